@@ -1,11 +1,34 @@
+import heapq
 import sqlite3
+import threading
+import time
 from pathlib import Path
 
+from ranker import CLUSTER_MAX_BOOST, RECENCY_MAX_BOOST, cluster_boost, recency_boost
+
 DB_PATH = Path.home() / ".local" / "share" / "nie" / "nie.db"
 
-SCHEMA = """
-PRAGMA journal_mode=WAL;
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 256
+
+ARTICLE_CACHE_TTL_HOURS = 24
+ARTICLE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+ARTICLE_CACHE_TOUCH_SEC = 600       # throttle accessed_ts writes on SD card
+COMPACT_MIN_FREE_RATIO = 0.25
+ARCHIVE_BATCH_SIZE = 500
+TICKER_FLOOR_SCAN = 20              # x max_items rows walked for the floor
+TICKER_FLOOR_STORIES = 4            # x max_items stories get an exact cluster boost
+TICKER_RECENCY_BANDS_H = (1, 2, 3, 4, 6, 8, 12, 16, 24, 36)
+
+_local = threading.local()
+
+_settings_cache = None
+_settings_lock = threading.Lock()
+_settings_listeners = {}
 
+# The schema as it was before versioned migrations; never edit it; every
+# later change is a step in MIGRATIONS.
+BASE_SCHEMA = """
 CREATE TABLE IF NOT EXISTS sources (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   name TEXT NOT NULL,
@@ -47,6 +70,11 @@ CREATE TABLE IF NOT EXISTS settings (
   value TEXT NOT NULL
 );
 
+CREATE TABLE IF NOT EXISTS schema_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL
+);
+
 CREATE INDEX IF NOT EXISTS idx_articles_score ON articles(score DESC);
 CREATE INDEX IF NOT EXISTS idx_articles_created ON articles(created_ts DESC);
 """
@@ -77,34 +105,158 @@ DEFAULTS = {
 
 
 def connect():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
+    # One long-lived handle per thread; callers must not close it
+    con = getattr(_local, "con", None)
+    if con is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(
+            DB_PATH,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        con.execute("PRAGMA foreign_keys=ON")
+        con.create_function("recency_boost", 2, recency_boost, deterministic=True)
+        con.create_function("cluster_boost", 1, cluster_boost, deterministic=True)
+        _local.con = con
     return con
 
 
+def close_connection():
+    con = getattr(_local, "con", None)
+    if con is not None:
+        _local.con = None
+        con.close()
+
+
 def init_db():
+    # Deployed databases only pay for the version read; steps run once each
     con = connect()
-    con.executescript(SCHEMA)
+    version = _schema_version(con)
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(con)
+        con.execute(
+            "INSERT OR REPLACE INTO schema_version(id, version) VALUES(1, ?)",
+            (target,),
+        )
+        con.commit()
+
+
+def _schema_version(con):
+    try:
+        row = con.execute("SELECT version FROM schema_version WHERE id=1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row["version"] if row else 0
+
+
+# Steps up to _ensure_defaults replay changes made before schema_version
+# existed. Databases from then start at 0 with some of them applied, so
+# those steps guard every change; later steps run exactly once.
+def _migrate_base_schema(con):
+    con.executescript(BASE_SCHEMA)
+
+
+def _migrate_feed_columns(con):
     _ensure_column(con, "articles", "image_url", "image_url TEXT")
+    _ensure_column(con, "articles", "content_hash", "content_hash TEXT")
+    _ensure_column(con, "sources", "etag", "etag TEXT")
+    _ensure_column(con, "sources", "last_modified", "last_modified TEXT")
 
-    cur = con.execute("SELECT COUNT(*) AS c FROM sources")
-    if cur.fetchone()["c"] == 0:
-        con.executemany(
-            "INSERT INTO sources(name,url,weight,enabled) VALUES(?,?,?,?)",
-            DEFAULTS["sources"]
-        )
 
-    cur = con.execute("SELECT COUNT(*) AS c FROM categories")
-    if cur.fetchone()["c"] == 0:
-        con.executemany(
-            "INSERT INTO categories(name,keywords,weight,enabled) VALUES(?,?,?,?)",
-            DEFAULTS["categories"]
-        )
-    _ensure_defaults(con)
+def _migrate_article_cache(con):
+    _ensure_column(con, "article_cache", "accessed_ts", "accessed_ts INTEGER")
+    _ensure_column(con, "article_cache", "size_bytes", "size_bytes INTEGER")
+    _ensure_column(con, "article_cache", "markup", "markup TEXT")
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_article_cache_accessed "
+        "ON article_cache(accessed_ts)"
+    )
+    con.execute(
+        "UPDATE article_cache SET "
+        "size_bytes=length(CAST(coalesce(text,'') AS BLOB)) + length(coalesce(image_url,'')), "
+        "accessed_ts=coalesce(accessed_ts, ?) "
+        "WHERE size_bytes IS NULL OR accessed_ts IS NULL",
+        (int(time.time()),),
+    )
 
-    con.commit()
-    con.close()
+
+def _migrate_story_clusters(con):
+    _ensure_column(con, "articles", "cluster_id", "cluster_id INTEGER")
+    _ensure_column(con, "articles", "minhash", "minhash BLOB")
+    con.executescript("""
+CREATE TABLE IF NOT EXISTS article_lsh (
+  band INTEGER NOT NULL,
+  bucket INTEGER NOT NULL,
+  article_id INTEGER NOT NULL,
+  PRIMARY KEY (band, bucket, article_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_article_lsh_article ON article_lsh(article_id);
+CREATE INDEX IF NOT EXISTS idx_articles_unclustered ON articles(id) WHERE minhash IS NULL;
+
+CREATE TRIGGER IF NOT EXISTS trg_articles_lsh_cleanup
+AFTER DELETE ON articles BEGIN
+  DELETE FROM article_lsh WHERE article_id = old.id;
+END;
+""")
+
+
+def _migrate_archive(con):
+    con.executescript("""
+CREATE TABLE IF NOT EXISTS articles_archive (
+  id INTEGER PRIMARY KEY,            -- same id the row had in articles
+  guid TEXT,
+  title TEXT NOT NULL,
+  link TEXT NOT NULL,
+  source_name TEXT,
+  published_ts INTEGER,
+  summary TEXT,
+  image_url TEXT,
+  score REAL,
+  cluster_id INTEGER,
+  created_ts INTEGER NOT NULL,
+  archived_ts INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_articles_archive_published ON articles_archive(published_ts);
+CREATE INDEX IF NOT EXISTS idx_articles_age ON articles(COALESCE(published_ts, created_ts));
+""")
+
+
+def _migrate_source_ids(con):
+    # The archive came before source ids but had no step of its own
+    _migrate_archive(con)
+    _ensure_column(
+        con, "articles", "source_id", "source_id INTEGER REFERENCES sources(id)"
+    )
+    _ensure_column(con, "articles_archive", "source_id", "source_id INTEGER")
+    con.execute(
+        """UPDATE articles SET source_id = (
+             SELECT MIN(s.id) FROM sources s WHERE s.name = articles.source_name
+           )
+           WHERE source_id IS NULL"""
+    )
+    _ensure_articles_cascade(con)
+    con.execute("DROP INDEX IF EXISTS idx_articles_source_guid")
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_articles_source_id_guid "
+        "ON articles(source_id, guid)"
+    )
+    # Covers the ticker candidate scan (score range, then source/cluster/
+    # recency columns) and the per-story source count
+    con.execute("DROP INDEX IF EXISTS idx_articles_score")
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_articles_ticker ON articles("
+        "score, source_id, cluster_id, published_ts, created_ts)"
+    )
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_articles_cluster_source "
+        "ON articles(cluster_id, source_id)"
+    )
 
 
 def _ensure_column(con, table, column, definition):
@@ -113,6 +265,88 @@ def _ensure_column(con, table, column, definition):
         con.execute(f"ALTER TABLE {table} ADD COLUMN {definition}")
 
 
+# articles as rebuilt by _ensure_articles_cascade; frozen like BASE_SCHEMA
+_CASCADE_ARTICLES_TABLE = """
+CREATE TABLE articles_new (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  guid TEXT UNIQUE,
+  title TEXT NOT NULL,
+  link TEXT NOT NULL,
+  source_name TEXT,
+  source_id INTEGER REFERENCES sources(id) ON DELETE CASCADE,
+  published_ts INTEGER,              -- unix seconds
+  summary TEXT,
+  image_url TEXT,
+  score REAL NOT NULL DEFAULT 0,      -- base score, recency applied at query time
+  content_hash TEXT,                 -- skips rewriting unchanged items
+  created_ts INTEGER NOT NULL,
+  cluster_id INTEGER,                -- id of the first article of the same story
+  minhash BLOB                       -- NULL until clustered, see dedup.py
+)
+"""
+
+
+def _ensure_articles_cascade(con):
+    # Databases that got source_id through ALTER TABLE lack ON DELETE CASCADE;
+    # SQLite can only add it by rebuilding the table
+    for fk in con.execute("PRAGMA foreign_key_list(articles)"):
+        if fk["from"] == "source_id" and fk["on_delete"] == "CASCADE":
+            return
+    columns = ",".join(
+        row["name"] for row in con.execute("PRAGMA table_info(articles)")
+    )
+    dependents = [
+        row["sql"]
+        for row in con.execute(
+            "SELECT sql FROM sqlite_master "
+            "WHERE tbl_name='articles' AND type IN ('index','trigger') "
+            "AND sql IS NOT NULL"
+        )
+    ]
+    con.commit()
+    con.execute("PRAGMA foreign_keys=OFF")
+    try:
+        with con:
+            con.execute("BEGIN")
+            con.execute(_CASCADE_ARTICLES_TABLE)
+            # rows whose source is gone were invisible already; drop them
+            con.execute(
+                f"""INSERT INTO articles_new({columns})
+                    SELECT {columns} FROM articles
+                    WHERE source_id IN (SELECT id FROM sources)"""
+            )
+            con.execute("DROP TABLE articles")
+            con.execute("ALTER TABLE articles_new RENAME TO articles")
+            # indexes and the LSH trigger were dropped with the old table
+            for sql in dependents:
+                con.execute(sql)
+            con.execute(
+                "DELETE FROM article_lsh "
+                "WHERE article_id NOT IN (SELECT id FROM articles)"
+            )
+    finally:
+        con.execute("PRAGMA foreign_keys=ON")
+
+
+def _unbake_recency_scores(con):
+    # Older versions stored score with the stepped recency boost added at insert
+    row = con.execute("SELECT value FROM settings WHERE key='score_model'").fetchone()
+    if row is not None and row["value"] == "base":
+        return
+    con.execute(
+        """UPDATE articles SET score = score - CASE
+             WHEN published_ts IS NULL OR published_ts = 0 THEN 0
+             WHEN created_ts - published_ts <= 3600 THEN 2.0
+             WHEN created_ts - published_ts <= 6 * 3600 THEN 1.2
+             WHEN created_ts - published_ts <= 24 * 3600 THEN 0.6
+             ELSE 0 END"""
+    )
+    con.execute(
+        "INSERT INTO settings(key,value) VALUES('score_model','base') "
+        "ON CONFLICT(key) DO UPDATE SET value=excluded.value"
+    )
+
+
 def _ensure_defaults(con):
     existing_sources = {
         row["url"] for row in con.execute("SELECT url FROM sources")
@@ -141,122 +375,174 @@ def _ensure_defaults(con):
         )
 
 
+def _recluster_plain_summaries(con):
+    # Signatures used to hash the summary's HTML markup and links; drop them
+    # so the next fetch clusters every article again
+    con.execute("DELETE FROM article_lsh")
+    con.execute("UPDATE articles SET minhash = NULL, cluster_id = NULL")
+
+
+def _index_archive_guids(con):
+    # Feed fetches skip guids that were already archived
+    con.execute("CREATE INDEX idx_articles_archive_guid ON articles_archive(guid)")
+
+
+# Append new steps at the end; the list index is the stored version.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_feed_columns,
+    _unbake_recency_scores,
+    _migrate_article_cache,
+    _migrate_story_clusters,
+    _migrate_source_ids,
+    _ensure_defaults,
+    _recluster_plain_summaries,
+    _index_archive_guids,
+]
+
+
 def list_sources():
     con = connect()
-    cur = con.execute(
+    return con.execute(
         "SELECT id,name,url,weight,enabled FROM sources ORDER BY name ASC"
-    )
-    rows = cur.fetchall()
-    con.close()
-    return rows
+    ).fetchall()
 
 
 def add_source(name, url, weight, enabled=1):
     con = connect()
-    cur = con.execute(
-        "INSERT INTO sources(name,url,weight,enabled) VALUES(?,?,?,?)",
-        (name, url, weight, enabled)
-    )
-    con.commit()
-    source_id = cur.lastrowid
-    con.close()
-    return source_id
+    with con:
+        cur = con.execute(
+            "INSERT INTO sources(name,url,weight,enabled) VALUES(?,?,?,?)",
+            (name, url, weight, enabled)
+        )
+    return cur.lastrowid
 
 
 def update_source(id, enabled, weight):
     con = connect()
-    con.execute(
-        "UPDATE sources SET enabled=?, weight=? WHERE id=?",
-        (enabled, weight, id)
-    )
-    con.commit()
-    con.close()
+    with con:
+        con.execute(
+            "UPDATE sources SET enabled=?, weight=? WHERE id=?",
+            (enabled, weight, id)
+        )
 
 
 def update_source_full(id, name, url, weight, enabled):
     con = connect()
-    con.execute(
-        "UPDATE sources SET name=?, url=?, weight=?, enabled=? WHERE id=?",
-        (name, url, weight, enabled, id)
-    )
-    con.commit()
-    con.close()
+    with con:
+        con.execute(
+            "UPDATE sources SET "
+            "etag=CASE WHEN url=? THEN etag END, "
+            "last_modified=CASE WHEN url=? THEN last_modified END, "
+            "name=?, url=?, weight=?, enabled=? WHERE id=?",
+            (url, url, name, url, weight, enabled, id)
+        )
+        # source_name is only a label kept for the archive; joins use source_id
+        con.execute(
+            "UPDATE articles SET source_name=? "
+            "WHERE source_id=? AND source_name IS NOT ?",
+            (name, id, name),
+        )
 
 
 def delete_source(id):
     con = connect()
-    con.execute("DELETE FROM sources WHERE id=?", (id,))
-    con.commit()
-    con.close()
+    with con:
+        con.execute("DELETE FROM sources WHERE id=?", (id,))
 
 
 def list_categories():
     con = connect()
-    cur = con.execute(
+    return con.execute(
         "SELECT id,name,keywords,weight,enabled FROM categories ORDER BY name ASC"
-    )
-    rows = cur.fetchall()
-    con.close()
-    return rows
+    ).fetchall()
 
 
 def add_category(name, keywords, weight, enabled=1):
     con = connect()
-    cur = con.execute(
-        "INSERT INTO categories(name,keywords,weight,enabled) VALUES(?,?,?,?)",
-        (name, keywords, weight, enabled)
-    )
-    con.commit()
-    category_id = cur.lastrowid
-    con.close()
-    return category_id
+    with con:
+        cur = con.execute(
+            "INSERT INTO categories(name,keywords,weight,enabled) VALUES(?,?,?,?)",
+            (name, keywords, weight, enabled)
+        )
+    return cur.lastrowid
 
 
 def update_category(category_id, name, keywords, weight, enabled):
     con = connect()
-    con.execute(
-        "UPDATE categories SET name=?, keywords=?, weight=?, enabled=? WHERE id=?",
-        (name, keywords, weight, enabled, category_id)
-    )
-    con.commit()
-    con.close()
+    with con:
+        con.execute(
+            "UPDATE categories SET name=?, keywords=?, weight=?, enabled=? WHERE id=?",
+            (name, keywords, weight, enabled, category_id)
+        )
 
 
 def delete_category(category_id):
     con = connect()
-    con.execute("DELETE FROM categories WHERE id=?", (category_id,))
-    con.commit()
-    con.close()
+    with con:
+        con.execute("DELETE FROM categories WHERE id=?", (category_id,))
+
+
+def _settings():
+    global _settings_cache
+    with _settings_lock:
+        if _settings_cache is None:
+            rows = connect().execute("SELECT key, value FROM settings").fetchall()
+            _settings_cache = {row["key"]: row["value"] for row in rows}
+        return _settings_cache
 
 
 def get_setting(key, default=None):
-    con = connect()
-    cur = con.execute("SELECT value FROM settings WHERE key=?", (key,))
-    row = cur.fetchone()
-    con.close()
-    if row is None:
-        return default
-    return row["value"]
+    return _settings().get(key, default)
 
 
 def set_setting(key, value):
-    con = connect()
-    con.execute(
-        "INSERT INTO settings(key,value) VALUES(?,?) "
-        "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-        (key, value)
-    )
-    con.commit()
-    con.close()
+    set_settings({key: value})
 
 
-def get_cached_article(url, max_age_hours=24):
+def set_settings(values):
+    cache = _settings()
+    con = connect()
+    with con:
+        con.executemany(
+            "INSERT INTO settings(key,value) VALUES(?,?) "
+            "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+            list(values.items()),
+        )
+    # Cache what SQLite stored (TEXT affinity), not the Python value passed in
+    placeholders = ",".join("?" for _ in values)
+    stored = con.execute(
+        f"SELECT key, value FROM settings WHERE key IN ({placeholders})",
+        tuple(values),
+    ).fetchall()
+    changed = []
+    with _settings_lock:
+        for row in stored:
+            if cache.get(row["key"]) != row["value"]:
+                cache[row["key"]] = row["value"]
+                changed.append((row["key"], row["value"]))
+    for key, value in changed:
+        for callback in list(_settings_listeners.get(key, ())):
+            callback(key, value)
+
+
+def subscribe_setting(key, callback):
+    _settings_listeners.setdefault(key, []).append(callback)
+
+
+def unsubscribe_setting(key, callback):
+    listeners = _settings_listeners.get(key, [])
+    if callback in listeners:
+        listeners.remove(callback)
+
+
+def get_cached_article(url, max_age_hours=ARTICLE_CACHE_TTL_HOURS):
     con = connect()
     row = con.execute(
-        "SELECT text, image_url, fetched_at FROM article_cache WHERE url=?",
+        "SELECT text, markup, image_url, fetched_at, accessed_ts "
+        "FROM article_cache WHERE url=?",
         (url,),
     ).fetchone()
-    con.close()
     if not row:
         return None
     if row["fetched_at"]:
@@ -265,19 +551,260 @@ def get_cached_article(url, max_age_hours=24):
         fetched_at = datetime.fromisoformat(row["fetched_at"])
         if datetime.now(timezone.utc) - fetched_at > timedelta(hours=max_age_hours):
             return None
-    return {"text": row["text"] or "", "image_url": row["image_url"]}
+    now = int(time.time())
+    if (row["accessed_ts"] or 0) < now - ARTICLE_CACHE_TOUCH_SEC:
+        with con:
+            con.execute(
+                "UPDATE article_cache SET accessed_ts=? WHERE url=?", (now, url)
+            )
+    return {
+        "text": row["text"] or "",
+        "markup": row["markup"],
+        "image_url": row["image_url"],
+    }
 
 
-def set_cached_article(url, text, image_url):
+def set_cached_article(url, text, image_url, markup=None):
     from datetime import datetime, timezone
 
+    size_bytes = (
+        len((text or "").encode("utf-8"))
+        + len((markup or "").encode("utf-8"))
+        + len(image_url or "")
+    )
     con = connect()
-    con.execute(
-        "INSERT INTO article_cache(url, text, image_url, fetched_at) "
-        "VALUES(?,?,?,?) "
-        "ON CONFLICT(url) DO UPDATE SET "
-        "text=excluded.text, image_url=excluded.image_url, fetched_at=excluded.fetched_at",
-        (url, text, image_url, datetime.now(timezone.utc).isoformat()),
+    with con:
+        con.execute(
+            "INSERT INTO article_cache(url, text, markup, image_url, fetched_at, accessed_ts, size_bytes) "
+            "VALUES(?,?,?,?,?,?,?) "
+            "ON CONFLICT(url) DO UPDATE SET "
+            "text=excluded.text, markup=excluded.markup, image_url=excluded.image_url, "
+            "fetched_at=excluded.fetched_at, accessed_ts=excluded.accessed_ts, "
+            "size_bytes=excluded.size_bytes",
+            (
+                url,
+                text,
+                markup,
+                image_url,
+                datetime.now(timezone.utc).isoformat(),
+                int(time.time()),
+                size_bytes,
+            ),
+        )
+
+
+def prune_article_cache(
+    max_bytes=ARTICLE_CACHE_MAX_BYTES, max_age_hours=ARTICLE_CACHE_TTL_HOURS
+):
+    from datetime import datetime, timezone, timedelta
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    con = connect()
+    with con:
+        expired = con.execute(
+            "DELETE FROM article_cache WHERE fetched_at < ?", (cutoff.isoformat(),)
+        ).rowcount
+        # Least recently read first, until the rest fits in the byte budget
+        evicted = con.execute(
+            """DELETE FROM article_cache WHERE url IN (
+                 SELECT url FROM (
+                   SELECT url,
+                          SUM(size_bytes) OVER (
+                            ORDER BY accessed_ts DESC, url
+                          ) AS running_bytes
+                   FROM article_cache
+                 )
+                 WHERE running_bytes > ?
+               )""",
+            (max_bytes,),
+        ).rowcount
+    return expired + evicted
+
+
+# Candidates come from a range scan of idx_articles_ticker bounded by
+# ticker_query_params; text columns are only read for the rows that make it
+# through LIMIT.
+TICKER_QUERY = """
+WITH candidates AS (
+  SELECT a.id,
+         COALESCE(a.cluster_id, a.id) AS story_id,
+         a.score + recency_boost(a.published_ts, :now) AS base_score,
+         a.created_ts
+  FROM articles a
+  JOIN sources s ON s.id = a.source_id
+  WHERE s.enabled = 1
+    AND a.score >= :threshold - :max_boost
+    -- upper bound on recency_boost by age band; plain SQL, so the Python
+    -- function only runs for rows that can still make the ticker
+    AND a.score + {recency_band_bound} >= :threshold - :cluster_boost
+),
+stories AS (
+  SELECT a.cluster_id AS story_id, COUNT(DISTINCT a.source_id) AS source_count
+  FROM articles a
+  JOIN sources s ON s.id = a.source_id
+  WHERE s.enabled = 1
+    AND a.cluster_id IN (SELECT story_id FROM candidates)
+  GROUP BY a.cluster_id
+),
+ranked AS (
+  SELECT c.id,
+         c.created_ts,
+         COALESCE(st.source_count, 1) AS source_count,
+         c.base_score + cluster_boost(COALESCE(st.source_count, 1)) AS score,
+         ROW_NUMBER() OVER (
+           PARTITION BY c.story_id
+           ORDER BY c.base_score DESC, c.created_ts DESC
+         ) AS story_rank
+  FROM candidates c
+  LEFT JOIN stories st ON st.story_id = c.story_id
+)
+SELECT a.title,
+       a.link,
+       s.name AS source_name,
+       r.score,
+       a.summary,
+       a.published_ts,
+       a.image_url,
+       r.source_count
+FROM ranked r
+JOIN articles a ON a.id = r.id
+JOIN sources s ON s.id = a.source_id
+WHERE r.story_rank = 1
+  AND r.score >= :min_score
+ORDER BY r.score DESC, r.created_ts DESC
+LIMIT :limit
+""".format(
+    recency_band_bound="CASE WHEN a.published_ts IS NULL OR a.published_ts = 0 THEN 0 "
+    + "".join(
+        f"WHEN a.published_ts >= :band_ts_{i} THEN :band_boost_{i - 1} "
+        for i in range(1, len(TICKER_RECENCY_BANDS_H) + 1)
     )
-    con.commit()
-    con.close()
+    + f"ELSE :band_boost_{len(TICKER_RECENCY_BANDS_H)} END"
+)
+
+
+def ticker_query_params(con, min_score, limit, now=None):
+    now = int(time.time()) if now is None else int(now)
+    params = {
+        "now": now,
+        "min_score": min_score,
+        "threshold": max(min_score, _ticker_score_floor(con, min_score, limit, now)),
+        "max_boost": RECENCY_MAX_BOOST + CLUSTER_MAX_BOOST,
+        "cluster_boost": CLUSTER_MAX_BOOST,
+        "limit": limit,
+    }
+    # band i covers ages up to TICKER_RECENCY_BANDS_H[i]; its boost is the
+    # largest recency_boost inside the band
+    band_start = 0
+    for i, hours in enumerate(TICKER_RECENCY_BANDS_H, start=1):
+        params[f"band_ts_{i}"] = now - int(hours * 3600)
+        params[f"band_boost_{i - 1}"] = recency_boost(now - band_start, now)
+        band_start = int(hours * 3600)
+    params[f"band_boost_{len(TICKER_RECENCY_BANDS_H)}"] = recency_boost(
+        now - band_start, now
+    )
+    return params
+
+
+def _ticker_score_floor(con, min_score, limit, now):
+    # Lower bound on the score of the max_items-th story: a story scores at
+    # least the best score + recency of any member plus its cluster boost.
+    # Rows that cannot reach it even with the full boost are not candidates.
+    # Walks the top of the score index only; stopping early just gives a
+    # lower (still correct) floor.
+    best = {}
+    floor = float("-inf")
+    rows = con.execute(
+        """SELECT a.score, a.published_ts, COALESCE(a.cluster_id, a.id) AS story_id
+           FROM articles a
+           JOIN sources s ON s.id = a.source_id
+           WHERE s.enabled = 1
+             AND a.score >= ?
+           ORDER BY a.score DESC""",
+        (min_score - RECENCY_MAX_BOOST - CLUSTER_MAX_BOOST,),
+    )
+    for idx, (score, published_ts, story_id) in enumerate(rows, start=1):
+        # stopping early only loosens the bound, so the walk is capped
+        if score + RECENCY_MAX_BOOST < floor or idx > TICKER_FLOOR_SCAN * limit:
+            break
+        value = score + recency_boost(published_ts, now)
+        if value > best.get(story_id, float("-inf")):
+            best[story_id] = value
+        if len(best) >= limit and idx % limit == 0:
+            floor = heapq.nlargest(limit, best.values())[-1]
+    rows.close()
+    if len(best) < limit:
+        return floor
+
+    # Adding the cluster boost of the strongest stories seen raises the
+    # floor further; any subset of stories still gives a valid bound.
+    boosted = []
+    for story_id, value in heapq.nlargest(
+        TICKER_FLOOR_STORIES * limit, best.items(), key=lambda item: item[1]
+    ):
+        source_count = con.execute(
+            """SELECT COUNT(DISTINCT a.source_id)
+               FROM articles a
+               JOIN sources s ON s.id = a.source_id
+               WHERE a.cluster_id = ? AND s.enabled = 1""",
+            (story_id,),
+        ).fetchone()[0]
+        boosted.append(value + cluster_boost(source_count))
+    return max(
+        floor,
+        heapq.nlargest(limit, best.values())[-1],
+        heapq.nlargest(limit, boosted)[-1],
+    )
+
+
+def load_ticker_articles(min_score, limit, now=None):
+    con = connect()
+    params = ticker_query_params(con, min_score, limit, now)
+    return con.execute(TICKER_QUERY, params).fetchall()
+
+
+def archive_articles(retention_days, batch_size=ARCHIVE_BATCH_SIZE):
+    # Moves articles older than the retention window to articles_archive in
+    # small transactions so the fetch thread is never blocked for long
+    now = int(time.time())
+    cutoff = now - int(retention_days * 86400)
+    con = connect()
+    moved = 0
+    while True:
+        with con:
+            ids = [
+                row["id"]
+                for row in con.execute(
+                    """SELECT id FROM articles
+                       WHERE COALESCE(published_ts, created_ts) < ?
+                       LIMIT ?""",
+                    (cutoff, batch_size),
+                )
+            ]
+            if not ids:
+                break
+            placeholders = ",".join("?" for _ in ids)
+            con.execute(
+                f"""INSERT OR REPLACE INTO articles_archive(
+                      id, guid, title, link, source_name, source_id, published_ts,
+                      summary, image_url, score, cluster_id, created_ts, archived_ts)
+                    SELECT id, guid, title, link, source_name, source_id, published_ts,
+                           summary, image_url, score, cluster_id, created_ts, ?
+                    FROM articles WHERE id IN ({placeholders})""",
+                (now, *ids),
+            )
+            con.execute(f"DELETE FROM articles WHERE id IN ({placeholders})", ids)
+        moved += len(ids)
+    return moved
+
+
+def compact_db(min_free_ratio=COMPACT_MIN_FREE_RATIO):
+    con = connect()
+    page_count = con.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = con.execute("PRAGMA freelist_count").fetchone()[0]
+    vacuumed = False
+    if page_count and freelist_count / page_count >= min_free_ratio:
+        con.execute("VACUUM")
+        vacuumed = True
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return vacuumed
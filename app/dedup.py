@@ -0,0 +1,131 @@
+import hashlib
+import html
+import random
+import re
+import struct
+
+from ranker import tokenize
+
+# MinHash signatures over title + summary tokens, bucketed with LSH bands
+# so a new article is only compared with articles sharing a band.
+SIGNATURE_SIZE = 32
+LSH_BANDS = 16
+LSH_ROWS = SIGNATURE_SIZE // LSH_BANDS
+DUPLICATE_SIMILARITY = 0.4          # estimated Jaccard needed to join a cluster
+MIN_TOKEN_LENGTH = 4                # drops most short stop words
+SUMMARY_TOKENS = 60
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x6E6965)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(SIGNATURE_SIZE)
+]
+_SIGNATURE_FORMAT = f"<{SIGNATURE_SIZE}Q"
+_TAG_RE = re.compile(r"<[^>]*>")
+_URL_RE = re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE)
+
+
+def _token_hash(token: str) -> int:
+    # Python's hash() is salted per process; signatures are stored on disk
+    return int.from_bytes(
+        hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def _summary_text(summary: str) -> str:
+    # Feed summaries are often HTML; their markup and links (href, https,
+    # _blank, nofollow, ...) would make unrelated items look alike
+    text = _TAG_RE.sub(" ", html.unescape(summary or ""))
+    return _URL_RE.sub(" ", text)
+
+
+def minhash_signature(title: str, summary: str) -> tuple[int, ...] | None:
+    tokens = tokenize(title) + tokenize(_summary_text(summary))[:SUMMARY_TOKENS]
+    hashes = {_token_hash(t) for t in tokens if len(t) >= MIN_TOKEN_LENGTH}
+    if not hashes:
+        return None
+    return tuple(
+        min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(sig_a, sig_b) -> float:
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / SIGNATURE_SIZE
+
+
+def lsh_buckets(signature) -> list[tuple[int, int]]:
+    buckets = []
+    for band in range(LSH_BANDS):
+        chunk = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(
+            struct.pack(f"<{LSH_ROWS}Q", *chunk), digest_size=8
+        ).digest()
+        buckets.append((band, int.from_bytes(digest, "little", signed=True)))
+    return buckets
+
+
+def pack_signature(signature) -> bytes:
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(blob: bytes) -> tuple[int, ...]:
+    return struct.unpack(_SIGNATURE_FORMAT, blob)
+
+
+def assign_clusters(con) -> int:
+    # Clusters every article without a signature yet (new or changed),
+    # oldest first so earlier stories become the cluster id. Returns how
+    # many of them joined an existing cluster from another source.
+    pending = con.execute(
+        """SELECT id, title, summary, source_id
+           FROM articles
+           WHERE minhash IS NULL
+           ORDER BY id"""
+    ).fetchall()
+    joined = 0
+    for row in pending:
+        con.execute("DELETE FROM article_lsh WHERE article_id = ?", (row["id"],))
+        signature = minhash_signature(row["title"], row["summary"] or "")
+        if signature is None:
+            con.execute(
+                "UPDATE articles SET minhash = X'', cluster_id = id WHERE id = ?",
+                (row["id"],),
+            )
+            continue
+
+        buckets = lsh_buckets(signature)
+        placeholders = ",".join("(?,?)" for _ in buckets)
+        candidates = con.execute(
+            f"""SELECT a.id, a.cluster_id, a.minhash
+                FROM articles a
+                WHERE a.id IN (
+                    SELECT l.article_id
+                    FROM (VALUES {placeholders}) AS b
+                    JOIN article_lsh l ON l.band = b.column1 AND l.bucket = b.column2
+                )
+                  AND a.source_id IS NOT ?
+                  AND a.cluster_id IS NOT NULL
+                  AND length(a.minhash) > 0""",
+            (*[v for bucket in buckets for v in bucket], row["source_id"]),
+        ).fetchall()
+
+        cluster_id = row["id"]
+        best = DUPLICATE_SIMILARITY
+        for cand in candidates:
+            score = similarity(signature, unpack_signature(cand["minhash"]))
+            if score >= best:
+                best = score
+                cluster_id = cand["cluster_id"]
+        if cluster_id != row["id"]:
+            joined += 1
+
+        con.execute(
+            "UPDATE articles SET minhash = ?, cluster_id = ? WHERE id = ?",
+            (pack_signature(signature), cluster_id, row["id"]),
+        )
+        con.executemany(
+            "INSERT OR IGNORE INTO article_lsh(band, bucket, article_id) VALUES(?,?,?)",
+            [(band, bucket, row["id"]) for band, bucket in buckets],
+        )
+    return joined
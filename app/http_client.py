@@ -0,0 +1,185 @@
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+USER_AGENT = "NIE/1.0 (+https://github.com/example/nie)"
+DEFAULT_TIMEOUT = 10
+CONNECT_TIMEOUT = 4               # get_content: a stuck connect can't be aborted
+POOL_HOSTS = 32                   # antall verter med egen keep-alive pool
+POOL_SIZE_PER_HOST = 4
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_BACKOFF_SEC = 0.5           # Retry-After ignoreres, kan være minutter
+
+_session = None
+_session_lock = threading.Lock()
+_local = threading.local()
+
+
+class Abort:
+    # Lets another thread cut off a get_content() call. Shutting down the
+    # socket wakes a header wait or body read blocked on it; closing the
+    # response alone does not.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sock = None
+        self.aborted = False
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            if self._sock is not None:
+                _shutdown(self._sock)
+
+    def _attach(self, conn):
+        with self._lock:
+            self._sock = conn.sock
+            if self.aborted and self._sock is not None:
+                _shutdown(self._sock)
+
+    def _detach(self, conn):
+        # Called before the connection goes back to the pool, so an abort
+        # never reaches a socket another request has taken
+        with self._lock:
+            if conn is not None and self._sock is conn.sock:
+                self._sock = None
+
+
+def _shutdown(sock):
+    try:
+        # the plain socket method: SSLSocket.shutdown also drops its TLS state
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _attach_current(conn):
+    abort = getattr(_local, "abort", None)
+    if abort is not None:
+        abort._attach(conn)
+
+
+def _detach_current(conn):
+    abort = getattr(_local, "abort", None)
+    if abort is not None:
+        abort._detach(conn)
+
+
+# Pooled connections report their socket to the Abort of the get_content()
+# call using them: reused ones when taken from the pool, new ones once
+# connected. Returning one to the pool takes it off again.
+class _AbortableConnectionMixin:
+    def connect(self):
+        super().connect()
+        _attach_current(self)
+
+
+class _AbortableHTTPConnection(_AbortableConnectionMixin, HTTPConnection):
+    pass
+
+
+class _AbortableHTTPSConnection(_AbortableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _AbortablePoolMixin:
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        _attach_current(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        _detach_current(conn)
+        super()._put_conn(conn)
+
+
+class _AbortableHTTPPool(_AbortablePoolMixin, HTTPConnectionPool):
+    ConnectionCls = _AbortableHTTPConnection
+
+
+class _AbortableHTTPSPool(_AbortablePoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _AbortableHTTPSConnection
+
+
+class _AbortableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _AbortableHTTPPool,
+            "https": _AbortableHTTPSPool,
+        }
+
+
+def session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            # No adapter-level retries: callers' timeouts must stay the upper
+            # bound on how long a feed or reader worker can be held up.
+            adapter = _AbortableAdapter(
+                pool_connections=POOL_HOSTS,
+                pool_maxsize=POOL_SIZE_PER_HOST,
+            )
+            s = requests.Session()
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            # Keep-alive pools skip the DNS lookup and TLS handshake for
+            # repeat hosts; requests already asks for gzip/deflate (and br)
+            s.headers["User-Agent"] = USER_AGENT
+            _session = s
+        return _session
+
+
+def get(
+    url: str,
+    timeout: float = DEFAULT_TIMEOUT,
+    headers: dict | None = None,
+    retries: int = 0,
+    **kwargs,
+) -> requests.Response:
+    # Opt-in retries for transient errors, with a short fixed backoff
+    for attempt in range(retries + 1):
+        try:
+            response = session().get(url, timeout=timeout, headers=headers, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            response.close()
+        time.sleep(RETRY_BACKOFF_SEC * 2 ** attempt)
+
+
+def get_content(
+    url: str,
+    is_cancelled=None,
+    timeout: float = DEFAULT_TIMEOUT,
+    abort: Abort | None = None,
+):
+    # Streams the body so a superseded download can be dropped between
+    # chunks, or at once through abort; returns None when cancelled or
+    # aborted, (bytes, encoding) otherwise
+    _local.abort = abort
+    try:
+        with get(url, timeout=(CONNECT_TIMEOUT, timeout), stream=True) as response:
+            response.raise_for_status()
+            chunks = []
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if is_cancelled is not None and is_cancelled():
+                    return None
+                chunks.append(chunk)
+            return b"".join(chunks), response.encoding
+    except Exception:
+        if abort is not None and abort.aborted:
+            return None
+        raise
+    finally:
+        _local.abort = None
@@ -0,0 +1,165 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import http_client
+from db import DB_PATH
+
+CACHE_DIR = DB_PATH.parent / "images"
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+THUMB_MAX_SIZE = (1280, 440)
+THUMB_QUALITY = 82
+LOAD_WORKERS = 2
+# Kivy picks its image loader by file extension, so entries keep one.
+_MAGIC_EXTS = (
+    (b"\xff\xd8", ".jpg"),
+    (b"\x89PNG", ".png"),
+    (b"GIF8", ".gif"),
+    (b"RIFF", ".webp"),
+)
+_CACHE_EXTS = tuple(ext for _magic, ext in _MAGIC_EXTS)
+
+_lock = threading.Lock()
+_total_bytes = None
+_target_size = THUMB_MAX_SIZE
+_loader = ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix="nie-image")
+
+
+def set_target_size(width: int, height: int):
+    global _target_size
+    _target_size = (max(1, int(width)), max(1, int(height)))
+
+
+def cache_path(url: str, ext: str = ".jpg"):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return CACHE_DIR / f"{key}{ext}"
+
+
+def get_cached_image(url: str) -> Optional[str]:
+    if not url:
+        return None
+    for ext in _CACHE_EXTS:
+        path = cache_path(url, ext)
+        try:
+            # mtime doubles as the LRU timestamp for eviction
+            os.utime(path)
+        except OSError:
+            continue
+        return str(path)
+    return None
+
+
+def fetch_image(url: str, is_cancelled: Optional[Callable[[], bool]] = None) -> Optional[str]:
+    if not url:
+        return None
+    cached = get_cached_image(url)
+    if cached:
+        return cached
+    try:
+        downloaded = http_client.get_content(url, is_cancelled=is_cancelled)
+    except Exception:
+        return None
+    if downloaded is None:
+        return None
+    data = downloaded[0]
+    # Images Pillow can't decode are cached as downloaded; formats the
+    # cache has no extension for (SVG, AVIF) go back to AsyncImage as the
+    # remote URL
+    return _store(url, _downscale(data) or data) or url
+
+
+def load_image_async(url: str, callback: Callable[[Optional[str]], None]):
+    def job():
+        try:
+            callback(fetch_image(url))
+        except Exception:
+            logging.exception("Image load failed for %s", url)
+
+    _loader.submit(job)
+
+
+def prune_image_cache(max_bytes: Optional[int] = None) -> int:
+    global _total_bytes
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    with _lock:
+        entries = []
+        total = 0
+        try:
+            with os.scandir(CACHE_DIR) as it:
+                for entry in it:
+                    if not entry.name.endswith(_CACHE_EXTS):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except FileNotFoundError:
+            _total_bytes = 0
+            return 0
+
+        removed = 0
+        if total > max_bytes:
+            entries.sort()
+            for _mtime, size, path in entries:
+                if total <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        _total_bytes = total
+        return removed
+
+
+def _store(url: str, data: bytes) -> Optional[str]:
+    global _total_bytes
+    ext = next((ext for magic, ext in _MAGIC_EXTS if data.startswith(magic)), None)
+    if ext is None:
+        return None
+    path = cache_path(url, ext)
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.exception("Could not store cached image for %s", url)
+        return None
+
+    with _lock:
+        over_budget = _total_bytes is None or _total_bytes + len(data) > CACHE_MAX_BYTES
+        if not over_budget:
+            _total_bytes += len(data)
+    if over_budget:
+        prune_image_cache()
+    return str(path)
+
+
+def _downscale(data: bytes) -> Optional[bytes]:
+    # Pillow is optional: without it the original file is cached as-is,
+    # which still saves the repeated download.
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("RGB", _target_size)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail(_target_size)
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=THUMB_QUALITY, optimize=True)
+            return out.getvalue()
+    except Exception:
+        return None
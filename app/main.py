@@ -3,6 +3,14 @@ from kivy.config import Config
 Config.set("graphics", "fullscreen", "auto")
 Config.set("graphics", "borderless", "1")
 
+if __name__ == "__main__":
+    # Fork the extraction workers before kivy.core.window below creates the
+    # SDL window and GL context; reader and its imports load no Kivy
+    from reader import start_extraction_pool
+
+    start_extraction_pool()
+
+import hashlib
 import logging
 import os
 import sys
@@ -11,8 +19,8 @@ import threading
 import webbrowser
 import sqlite3
 import subprocess
-import json
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
 
 from kivy.app import App
@@ -41,6 +49,8 @@ from db import (
     list_sources,
     get_setting,
     set_setting,
+    set_settings,
+    subscribe_setting,
     add_source,
     update_source,
     update_source_full,
@@ -49,11 +59,28 @@ from db import (
     add_category,
     update_category,
     delete_category,
+    prune_article_cache,
+    archive_articles,
+    compact_db,
+    load_ticker_articles,
+)
+import http_client
+from image_cache import (
+    get_cached_image,
+    load_image_async,
+    prune_image_cache,
+    set_target_size,
 )
 from rss import fetch_feed
-from ranker import score_article, recency_boost
+from dedup import assign_clusters
+from ranker import build_matcher, score_article
 from settings import EngineConfig
-from reader import html_to_simple_markup, fetch_article_content
+from reader import (
+    cached_markup,
+    get_rendered_article,
+    prefetch_articles,
+    ReaderWorker,
+)
 
 COLOR_THEME = {
     "background": (0.05, 0.08, 0.12, 1),
@@ -113,6 +140,18 @@ CRYPTO_COINS = (
     {"id": "cardano", "label": "Cardano"},
 )
 
+LIVE_SETTING_KEYS = (
+    "fetch_interval_sec",
+    "ticker_interval_sec",
+    "news_rotation_seconds",
+    "crypto_rotation_seconds",
+    "min_score",
+    "feed_timeout_sec",
+    "fetch_deadline_sec",
+    "retention_days",
+    "color_theme",
+)
+
 POSITIVE_COLOR = (0.2, 0.8, 0.4, 1)
 NEGATIVE_COLOR = (0.9, 0.3, 0.3, 1)
 
@@ -882,6 +921,10 @@ class AdminScreen(Screen):
         self._min_score_input = self._settings_input()
         settings_grid.add_widget(self._min_score_input)
 
+        settings_grid.add_widget(self._settings_label("Behold saker (dager)"))
+        self._retention_input = self._settings_input()
+        settings_grid.add_widget(self._retention_input)
+
         settings_grid.add_widget(self._settings_label("Fargetema"))
         self._theme_spinner = Spinner(
             text=THEME_CHOICES[0],
@@ -965,6 +1008,10 @@ class AdminScreen(Screen):
             self._min_score_input.text = str(
                 get_setting("min_score", defaults.min_score)
             )
+        if hasattr(self, "_retention_input"):
+            self._retention_input.text = str(
+                get_setting("retention_days", defaults.retention_days)
+            )
         if hasattr(self, "_rotation_input"):
             self._rotation_input.text = str(
                 get_setting("news_rotation_seconds", defaults.news_rotation_seconds)
@@ -1043,6 +1090,15 @@ class AdminScreen(Screen):
         if hasattr(self, "_status_label"):
             self._status_label.text = message
 
+    def _rescore(self, source_ids=(), keywords=""):
+        app = App.get_running_app()
+        if app:
+            app.rescore_articles(
+                source_ids=source_ids,
+                keywords=keywords,
+                status_callback=self._set_status,
+            )
+
     def trigger_update(self):
         app = App.get_running_app()
         if not app:
@@ -1058,12 +1114,16 @@ class AdminScreen(Screen):
 
         def worker():
             try:
-                inserted, failed_sources, total_sources = app.fetch_and_rank()
+                counts, failed_sources, total_sources = app.fetch_and_rank()
                 if total_sources == 0:
                     set_status("Oppdatering feilet: ingen kilder")
                     return
                 if failed_sources == 0:
-                    set_status(f"Oppdatert: {inserted} nye saker")
+                    set_status(
+                        f"Oppdatert: {counts['new']} nye, "
+                        f"{counts['updated']} endret, "
+                        f"{counts['unchanged']} uendret"
+                    )
                 elif failed_sources < total_sources:
                     set_status(f"Oppdatert med feil: {failed_sources} kilde feilet")
                 else:
@@ -1083,6 +1143,7 @@ class AdminScreen(Screen):
             news_rotation_seconds = int(self._rotation_input.text.strip())
             crypto_rotation_seconds = int(self._crypto_rotation_input.text.strip())
             min_score = float(self._min_score_input.text.strip())
+            retention_days = int(self._retention_input.text.strip())
         except ValueError:
             self._set_status("Ugyldig format i innstillinger.")
             return
@@ -1093,29 +1154,23 @@ class AdminScreen(Screen):
         if news_rotation_seconds < 5 or crypto_rotation_seconds < 5:
             self._set_status("Rotasjonsintervall må være minst 5 sekunder.")
             return
+        if retention_days < 1:
+            self._set_status("Saker må beholdes minst 1 dag.")
+            return
 
-        set_setting("fetch_interval_sec", fetch_interval)
-        set_setting("ticker_interval_sec", ticker_interval)
-        set_setting("news_rotation_seconds", news_rotation_seconds)
-        set_setting("crypto_rotation_seconds", crypto_rotation_seconds)
-        set_setting("min_score", min_score)
-        app = App.get_running_app()
-        if app:
-            app.apply_settings(
-                fetch_interval,
-                ticker_interval,
-                news_rotation_seconds,
-                crypto_rotation_seconds,
-                min_score,
-            )
+        set_settings({
+            "fetch_interval_sec": fetch_interval,
+            "ticker_interval_sec": ticker_interval,
+            "news_rotation_seconds": news_rotation_seconds,
+            "crypto_rotation_seconds": crypto_rotation_seconds,
+            "min_score": min_score,
+            "retention_days": retention_days,
+        })
         self._set_status("Innstillinger lagret.")
 
     def _apply_theme_setting(self, theme_label):
         theme_index = THEME_INDEX_BY_LABEL.get(theme_label, 1)
         set_setting("color_theme", theme_index)
-        app = App.get_running_app()
-        if app:
-            app.apply_color_theme(theme_index)
 
     def _fetch_update_from_github(self):
         app = App.get_running_app()
@@ -1185,12 +1240,15 @@ class AdminScreen(Screen):
             except ValueError:
                 self._set_status("Weight må være et tall.")
                 return
+            weight_changed = weight != weight_value
             weight_value = weight
             update_source(source["id"], int(enabled_switch.active), weight_value)
+            self._set_status("Kilde oppdatert.")
             app = App.get_running_app()
             if app:
                 app.reload_ticker_articles()
-            self._set_status("Kilde oppdatert.")
+            if weight_changed:
+                self._rescore(source_ids=[source["id"]])
 
         def apply_enabled_update(*_args):
             update_source(source["id"], int(enabled_switch.active), weight_value)
@@ -1221,6 +1279,7 @@ class AdminScreen(Screen):
         self._source_rows.append(
             {
                 "id": source["id"],
+                "weight": source["weight"],
                 "weight_input": weight_input,
                 "enabled_switch": enabled_switch,
             }
@@ -1290,6 +1349,8 @@ class AdminScreen(Screen):
             app = App.get_running_app()
             if app:
                 app.reload_ticker_articles()
+            if weight != source["weight"]:
+                self._rescore(source_ids=[source["id"]])
 
         save_button = Button(text="Lagre")
         cancel_button = Button(text="Avbryt")
@@ -1356,6 +1417,8 @@ class AdminScreen(Screen):
         self._new_category_enabled.active = True
         self._set_status("Kategori lagt til.")
         self.refresh_categories()
+        if enabled:
+            self._rescore(keywords=keywords)
 
     def _add_category_row(self, category):
         enabled_switch = Switch(active=bool(category["enabled"]))
@@ -1382,13 +1445,19 @@ class AdminScreen(Screen):
             height=dp(60),
         )
         keywords_label.bind(size=keywords_label.setter("text_size"))
+        weight_value = category["weight"]
+        enabled_value = bool(category["enabled"])
 
         def apply_update(*_args):
+            nonlocal weight_value, enabled_value
             try:
                 weight = float(weight_input.text.strip())
             except ValueError:
                 self._set_status("Weight må være et tall.")
                 return
+            changed = weight != weight_value or enabled_switch.active != enabled_value
+            weight_value = weight
+            enabled_value = enabled_switch.active
             update_category(
                 category["id"],
                 category["name"],
@@ -1397,6 +1466,8 @@ class AdminScreen(Screen):
                 int(enabled_switch.active),
             )
             self._set_status("Kategori oppdatert.")
+            if changed:
+                self._rescore(keywords=category["keywords"])
 
         enabled_switch.bind(on_active=lambda *_: apply_update())
         weight_input.bind(on_text_validate=lambda *_: apply_update())
@@ -1422,6 +1493,8 @@ class AdminScreen(Screen):
                 "id": category["id"],
                 "name": category["name"],
                 "keywords": category["keywords"],
+                "weight": category["weight"],
+                "enabled": bool(category["enabled"]),
                 "weight_input": weight_input,
                 "enabled_switch": enabled_switch,
             }
@@ -1432,6 +1505,7 @@ class AdminScreen(Screen):
         if not rows:
             self._set_status("Ingen kilder å lagre.")
             return
+        changed_ids = []
         for row in rows:
             try:
                 weight = float(row["weight_input"].text.strip())
@@ -1439,30 +1513,41 @@ class AdminScreen(Screen):
                 self._set_status("Weight må være et tall.")
                 return
             update_source(row["id"], int(row["enabled_switch"].active), weight)
+            if weight != row["weight"]:
+                row["weight"] = weight
+                changed_ids.append(row["id"])
         app = App.get_running_app()
         if app:
             app.reload_ticker_articles()
         self._set_status("Kilder lagret.")
+        self._rescore(source_ids=changed_ids)
 
     def _save_categories(self):
         rows = getattr(self, "_category_rows", [])
         if not rows:
             self._set_status("Ingen kategorier å lagre.")
             return
+        changed_keywords = []
         for row in rows:
             try:
                 weight = float(row["weight_input"].text.strip())
             except ValueError:
                 self._set_status("Weight må være et tall.")
                 return
+            enabled = row["enabled_switch"].active
             update_category(
                 row["id"],
                 row["name"],
                 row["keywords"],
                 weight,
-                int(row["enabled_switch"].active),
+                int(enabled),
             )
+            if weight != row["weight"] or enabled != row["enabled"]:
+                row["weight"] = weight
+                row["enabled"] = enabled
+                changed_keywords.append(row["keywords"])
         self._set_status("Kategorier lagret.")
+        self._rescore(keywords=",".join(changed_keywords))
 
     def _edit_category_popup(self, category):
         content = BoxLayout(orientation="vertical", spacing=dp(8), padding=dp(12))
@@ -1530,6 +1615,7 @@ class AdminScreen(Screen):
             popup.dismiss()
             self._set_status("Kategori oppdatert.")
             self.refresh_categories()
+            self._rescore(keywords=f'{category["keywords"]},{keywords}')
 
         save_button = Button(text="Lagre")
         cancel_button = Button(text="Avbryt")
@@ -1558,6 +1644,7 @@ class AdminScreen(Screen):
             popup.dismiss()
             self._set_status("Kategori slettet.")
             self.refresh_categories()
+            self._rescore(keywords=category["keywords"])
 
         delete_button = Button(text="Slett")
         cancel_button = Button(text="Avbryt")
@@ -1578,6 +1665,8 @@ class ReaderScreen(Screen):
         self.current_article = None
         self._fetch_token = 0
         self._pending_theme = None
+        self._reader_worker = ReaderWorker()
+        self._image_url = None
 
     def on_pre_enter(self, *_args):
         if not self._ui_built:
@@ -1760,32 +1849,35 @@ class ReaderScreen(Screen):
         image_url = article.get("image_url")
         self._set_image(image_url)
 
-        summary = article.get("summary") or ""
-        self._body_label.text = html_to_simple_markup(summary)
         self._note_label.text = ""
         self._note_label.opacity = 0
         self._note_label.height = 0
 
-        def worker():
-            result = fetch_article_content(
-                article.get("link", ""),
-                rss_summary=summary,
-                rss_image_url=image_url,
-            )
+        link = article.get("link", "")
+        summary = article.get("summary") or ""
+        rendered = get_rendered_article(link)
+        if rendered is not None and rendered.get("markup"):
+            self._reader_worker.cancel()
+            self._apply_fulltext(rendered, fetch_token)
+            return
+
+        self._body_label.text = cached_markup(summary)
+
+        def on_loaded(result):
             Clock.schedule_once(
                 lambda *_: self._apply_fulltext(result, fetch_token), 0
             )
 
-        threading.Thread(target=worker, daemon=True).start()
+        self._reader_worker.submit(article, on_loaded)
 
     def _apply_fulltext(self, result, fetch_token):
         if fetch_token != self._fetch_token:
             return
         if not result:
             return
-        text = result.get("text", "")
-        if text:
-            self._body_label.text = html_to_simple_markup(text)
+        markup = result.get("markup", "")
+        if markup:
+            self._body_label.text = markup
         if result.get("image_url") and not self.current_article.get("image_url"):
             self._set_image(result.get("image_url"))
         if result.get("used_fallback"):
@@ -1800,8 +1892,27 @@ class ReaderScreen(Screen):
         instance.text_size = (instance.width, None)
 
     def _set_image(self, image_url):
-        if image_url:
-            self._image.source = image_url
+        self._image_url = image_url
+        cached = get_cached_image(image_url)
+        if cached:
+            self._show_image(cached)
+            return
+        self._show_image(None)
+        if not image_url:
+            return
+
+        def on_loaded(path):
+            Clock.schedule_once(lambda *_: self._apply_image(image_url, path), 0)
+
+        load_image_async(image_url, on_loaded)
+
+    def _apply_image(self, image_url, path):
+        if path and image_url == self._image_url:
+            self._show_image(path)
+
+    def _show_image(self, path):
+        if path:
+            self._image.source = path
             self._image.opacity = 1
             self._image.height = dp(220)
         else:
@@ -1821,6 +1932,7 @@ class ReaderScreen(Screen):
 class NIEApp(App):
     def build(self):
         init_db()
+        set_target_size(Window.width, dp(220))
         self.cfg = EngineConfig()
         self._load_settings_from_db()
 
@@ -1846,6 +1958,8 @@ class NIEApp(App):
         self._crypto_cache = {}
         self._crypto_cache_time = 0.0
         self._crypto_fetching = False
+        self._prefetching = False
+        self._last_maintenance = 0.0
 
         threading.Thread(target=self.engine_loop, daemon=True).start()
 
@@ -1863,6 +1977,10 @@ class NIEApp(App):
         self._startup_theme_smoke_check()
         self.apply_color_theme(self.theme_index)
 
+        self._settings_trigger = Clock.create_trigger(self._reload_settings)
+        for key in LIVE_SETTING_KEYS:
+            subscribe_setting(key, lambda *_: self._settings_trigger())
+
         return self.sm
 
     def _startup_theme_smoke_check(self):
@@ -1883,7 +2001,10 @@ class NIEApp(App):
             self._ticker_idx += 1
 
         self.ticker.headline = a["title"]
-        self.ticker.subline = f'{a["source_name"]} | score {a["score"]:.1f}'
+        source_label = a["source_name"]
+        if a.get("source_count", 1) > 1:
+            source_label += f' +{a["source_count"] - 1} kilder'
+        self.ticker.subline = f'{source_label} | score {a["score"]:.1f}'
         self.ticker.current_link = a["link"]
         self._current_article = a
 
@@ -1945,8 +2066,9 @@ class NIEApp(App):
             f"?vs_currency=usd&ids={ids}"
             "&sparkline=true&price_change_percentage=1h,24h"
         )
-        with urllib.request.urlopen(url, timeout=10) as response:
-            data = json.load(response)
+        response = http_client.get(url, retries=2)
+        response.raise_for_status()
+        data = response.json()
         result = {}
         for item in data:
             coin_id = item.get("id")
@@ -2077,6 +2199,19 @@ class NIEApp(App):
         )
         self._schedule_rotation(rotation_delay)
 
+    def _reload_settings(self, *_args):
+        theme_index = self.theme_index
+        self._load_settings_from_db()
+        self.apply_settings(
+            self.cfg.fetch_interval_sec,
+            self.cfg.ticker_interval_sec,
+            self.cfg.news_rotation_seconds,
+            self.cfg.crypto_rotation_seconds,
+            self.cfg.min_score,
+        )
+        if self.theme_index != theme_index:
+            self.apply_color_theme(self.theme_index)
+
     def _load_settings_from_db(self):
         defaults = EngineConfig()
         fetch_interval = int(
@@ -2097,6 +2232,15 @@ class NIEApp(App):
             )
         )
         min_score = float(get_setting("min_score", defaults.min_score))
+        feed_timeout_sec = int(
+            get_setting("feed_timeout_sec", defaults.feed_timeout_sec)
+        )
+        fetch_deadline_sec = int(
+            get_setting("fetch_deadline_sec", defaults.fetch_deadline_sec)
+        )
+        retention_days = int(
+            get_setting("retention_days", defaults.retention_days)
+        )
         theme_index = int(get_setting("color_theme", 1))
         if theme_index not in THEME_MAP:
             theme_index = 1
@@ -2107,6 +2251,9 @@ class NIEApp(App):
         self.cfg.news_rotation_seconds = news_rotation_seconds
         self.cfg.crypto_rotation_seconds = crypto_rotation_seconds
         self.cfg.min_score = min_score
+        self.cfg.feed_timeout_sec = feed_timeout_sec
+        self.cfg.fetch_deadline_sec = fetch_deadline_sec
+        self.cfg.retention_days = retention_days
 
     def engine_loop(self):
         while True:
@@ -2114,25 +2261,29 @@ class NIEApp(App):
                 self.fetch_and_rank()
             except Exception as e:
                 print("Engine error:", e)
+            self._maintain_storage()
             time.sleep(self.cfg.fetch_interval_sec)
 
-    def _load_ticker_articles(self, con):
-        rows = con.execute(
-            """SELECT a.title,
-                      a.link,
-                      a.source_name,
-                      a.score,
-                      a.summary,
-                      a.published_ts,
-                      a.image_url
-               FROM articles a
-               JOIN sources s ON a.source_name = s.name
-               WHERE s.enabled = 1
-                 AND a.score >= ?
-               ORDER BY a.score DESC, a.created_ts DESC
-               LIMIT ?""",
-            (self.cfg.min_score, self.cfg.max_items),
-        ).fetchall()
+    def _maintain_storage(self):
+        now = time.time()
+        if now - self._last_maintenance < self.cfg.maintenance_interval_sec:
+            return
+        self._last_maintenance = now
+        try:
+            archived = archive_articles(self.cfg.retention_days)
+            removed = prune_article_cache()
+            images_removed = prune_image_cache()
+            vacuumed = compact_db()
+            print(
+                f"Articles archived: {archived}, article cache pruned: {removed}, "
+                f"images pruned: {images_removed}, vacuumed: {vacuumed}"
+            )
+        except Exception:
+            logging.exception("Storage maintenance failed")
+
+    def _load_ticker_articles(self):
+        # One row per story cluster, boosted by how many sources carry it
+        rows = load_ticker_articles(self.cfg.min_score, self.cfg.max_items)
 
         with self._lock:
             self._articles = [dict(r) for r in rows]
@@ -2141,82 +2292,276 @@ class NIEApp(App):
         return rows
 
     def reload_ticker_articles(self):
-        con = connect()
-        try:
-            rows = self._load_ticker_articles(con)
-        finally:
-            con.close()
+        rows = self._load_ticker_articles()
         return len(rows)
 
-    def fetch_and_rank(self):
+    def rescore_articles(self, source_ids=(), keywords="", status_callback=None):
+        source_ids = set(source_ids)
+        if not source_ids and not keywords.strip():
+            return
+
+        def set_status(message):
+            if status_callback:
+                Clock.schedule_once(lambda *_: status_callback(message), 0)
+
+        def worker():
+            try:
+                updated = self._rescore(source_ids, keywords, set_status)
+            except Exception:
+                logging.exception("Rescoring failed")
+                set_status("Omberegning av score feilet.")
+                return
+            Clock.schedule_once(lambda *_: self.reload_ticker_articles(), 0)
+            set_status(f"Score oppdatert for {updated} saker.")
+
+        set_status("Omberegner score…")
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _rescore(self, source_ids, keywords, set_status):
         con = connect()
+        categories = self._load_categories(con)
+        matcher = build_matcher(categories)
+        query = """SELECT a.id, a.title, a.summary, a.score,
+                          s.id AS source_id, s.weight
+                   FROM articles a
+                   JOIN sources s ON s.id = a.source_id"""
+        params = ()
+        changed = None
+        if keywords.strip():
+            changed = build_matcher([{
+                "name": "changed",
+                "keywords": keywords,
+                "weight": 1.0,
+                "enabled": True,
+            }])
+        else:
+            placeholders = ",".join("?" for _ in source_ids)
+            query += f" WHERE s.id IN ({placeholders})"
+            params = tuple(source_ids)
+        rows = con.execute(query, params).fetchall()
+
+        affected = [
+            r for r in rows
+            if r["source_id"] in source_ids
+            or (
+                changed is not None
+                and changed.category_hits(r["title"] + " " + (r["summary"] or ""))
+            )
+        ]
+        updates = []
+        for idx, r in enumerate(affected, 1):
+            score = score_article(
+                r["title"],
+                r["summary"],
+                r["weight"],
+                categories,
+                matcher,
+            )
+            if score != r["score"]:
+                updates.append((score, r["id"]))
+            if idx % 200 == 0:
+                set_status(f"Omberegner score: {idx}/{len(affected)}")
 
-        sources = con.execute("SELECT * FROM sources WHERE enabled=1").fetchall()
+        with con:
+            con.executemany("UPDATE articles SET score=? WHERE id=?", updates)
+        return len(updates)
+
+    def _load_categories(self, con):
         cats = con.execute("SELECT * FROM categories WHERE enabled=1").fetchall()
-        categories = [{
+        return [{
             "name": c["name"],
             "keywords": c["keywords"],
             "weight": c["weight"],
             "enabled": bool(c["enabled"]),
         } for c in cats]
 
+    def fetch_and_rank(self):
+        con = connect()
+
+        sources = con.execute("SELECT * FROM sources WHERE enabled=1").fetchall()
+        categories = self._load_categories(con)
+        matcher = build_matcher(categories)
+
         now = int(time.time())
+        cutoff_ts = now - self.cfg.retention_days * 86400
 
-        inserted = 0
+        counts = {"new": 0, "updated": 0, "unchanged": 0}
         failed_sources = 0
         total_sources = len(sources)
-        for s in sources:
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, self.cfg.fetch_workers),
+            thread_name_prefix="nie-feed",
+        )
+        futures = {
+            executor.submit(
+                fetch_feed,
+                s["url"],
+                self.cfg.feed_timeout_sec,
+                s["etag"],
+                s["last_modified"],
+            ): s
+            for s in sources
+        }
+        try:
+            for future in as_completed(futures, timeout=self.cfg.fetch_deadline_sec):
+                s = futures.pop(future)
+                try:
+                    feed = future.result()
+                except Exception:
+                    failed_sources += 1
+                    logging.exception("Feed fetch failed for %s", s["url"])
+                    continue
+                if feed["not_modified"]:
+                    continue
+                with con:
+                    source_counts = self._store_source_items(
+                        con, s, feed["items"], categories, matcher, now, cutoff_ts
+                    )
+                    con.execute(
+                        "UPDATE sources SET etag=?, last_modified=? WHERE id=?",
+                        (feed["etag"], feed["modified"], s["id"]),
+                    )
+                for key, value in source_counts.items():
+                    counts[key] += value
+        except FuturesTimeoutError:
+            failed_sources += len(futures)
+            for s in futures.values():
+                logging.warning("Feed fetch timed out for %s", s["url"])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        with con:
+            clustered = assign_clusters(con)
+
+        rows = self._load_ticker_articles()
+        self.start_prefetch(rows[:self.cfg.prefetch_top_n])
+
+        print(
+            f"Fetched new: {counts['new']}, updated: {counts['updated']}, "
+            f"unchanged: {counts['unchanged']}, duplicates: {clustered}, "
+            f"ticker items: {len(rows)}"
+        )
+        return counts, failed_sources, total_sources
+
+    def start_prefetch(self, rows):
+        with self._lock:
+            if self._prefetching or not rows:
+                return
+            self._prefetching = True
+        articles = [dict(r) for r in rows]
+
+        def worker():
             try:
-                items = fetch_feed(s["url"])
+                warmed = prefetch_articles(
+                    articles,
+                    max_workers=self.cfg.prefetch_workers,
+                    host_delay=self.cfg.prefetch_host_delay_sec,
+                )
+                if warmed:
+                    print(f"Prefetched full text: {warmed}")
             except Exception:
-                failed_sources += 1
-                logging.exception("Feed fetch failed for %s", s["url"])
+                logging.exception("Prefetch failed")
+            finally:
+                with self._lock:
+                    self._prefetching = False
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _store_source_items(self, con, s, items, categories, matcher, now, cutoff_ts):
+        # Items that drop out of the feed stay until archive_articles moves
+        # them out of the retention window. Items still in the feed after
+        # that are not stored again, dated or not.
+        counts = {"new": 0, "updated": 0, "unchanged": 0}
+        # Looked up across all sources: guids are unique in articles, and the
+        # upsert below leaves a row owned by another source untouched
+        guids = [it["guid"] for it in items]
+        placeholders = ",".join("?" for _ in guids)
+        known = {
+            row["guid"]: (row["source_id"], row["content_hash"], row["score"])
+            for row in con.execute(
+                f"""SELECT guid, source_id, content_hash, score
+                    FROM articles WHERE guid IN ({placeholders})""",
+                guids,
+            )
+        }
+        archived = {
+            row["guid"]
+            for row in con.execute(
+                f"SELECT guid FROM articles_archive WHERE guid IN ({placeholders})",
+                guids,
+            )
+        }
+
+        rows = []
+        for it in items:
+            if it["guid"] in archived or (it["published_ts"] or now) < cutoff_ts:
+                # already past retention; re-inserting would only churn
                 continue
-            current_guids = {it["guid"] for it in items if it.get("guid")}
-            if current_guids:
-                placeholders = ",".join("?" for _ in current_guids)
-                con.execute(
-                    f"""DELETE FROM articles
-                        WHERE source_name = ?
-                          AND guid NOT IN ({placeholders})""",
-                    (s["name"], *current_guids),
-                )
-            for it in items:
-                base_score = score_article(
+            known_row = known.get(it["guid"])
+            if known_row is not None and known_row[0] != s["id"]:
+                counts["unchanged"] += 1
+                continue
+            score = score_article(
+                it["title"],
+                it["summary"],
+                s["weight"],
+                categories,
+                matcher,
+            )
+            content_hash = _content_hash(it)
+            if known_row is None:
+                counts["new"] += 1
+            elif known_row[1:] != (content_hash, score):
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+                continue
+            known[it["guid"]] = (s["id"], content_hash, score)
+            rows.append(
+                (
+                    it["guid"],
                     it["title"],
+                    it["link"],
+                    s["name"],
+                    s["id"],
+                    it["published_ts"],
                     it["summary"],
-                    s["weight"],
-                    categories,
+                    it.get("image_url"),
+                    score,
+                    content_hash,
+                    now,
                 )
-                score = base_score + recency_boost(it["published_ts"])
-
-                try:
-                    con.execute(
-                        """INSERT INTO articles(guid,title,link,source_name,published_ts,summary,image_url,score,created_ts)
-                           VALUES(?,?,?,?,?,?,?,?,?)""",
-                        (
-                            it["guid"],
-                            it["title"],
-                            it["link"],
-                            s["name"],
-                            it["published_ts"],
-                            it["summary"],
-                            it.get("image_url"),
-                            score,
-                            now,
-                        )
-                    )
-                    inserted += 1
-                except Exception:
-                    pass
-
-        con.commit()
-
-        rows = self._load_ticker_articles(con)
-        con.close()
+            )
 
-        print(f"Fetched/inserted: {inserted}, ticker items: {len(rows)}")
-        return inserted, failed_sources, total_sources
+        con.executemany(
+            """INSERT INTO articles(guid,title,link,source_name,source_id,published_ts,summary,image_url,score,content_hash,created_ts)
+               VALUES(?,?,?,?,?,?,?,?,?,?,?)
+               ON CONFLICT(guid) DO UPDATE SET
+                 title=excluded.title,
+                 link=excluded.link,
+                 published_ts=excluded.published_ts,
+                 summary=excluded.summary,
+                 image_url=excluded.image_url,
+                 score=excluded.score,
+                 content_hash=excluded.content_hash,
+                 minhash=NULL
+               WHERE articles.source_id = excluded.source_id
+                 AND (articles.content_hash IS NOT excluded.content_hash
+                      OR articles.score != excluded.score)""",
+            rows,
+        )
+        return counts
+
+
+def _content_hash(item):
+    parts = (
+        item["title"],
+        item["link"],
+        item["summary"] or "",
+        item.get("image_url") or "",
+        str(item["published_ts"] or ""),
+    )
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
 
 
 if __name__ == "__main__":
@@ -1,13 +1,85 @@
+import math
 import time
 import re
+import unicodedata
+
+
+RECENCY_MAX_BOOST = 2.0
+RECENCY_HALF_LIFE_SEC = 8 * 3600
+CLUSTER_BOOST_PER_DOUBLING = 1.0
+CLUSTER_MAX_BOOST = 2.0
 
 
 def normalize(text: str) -> str:
     return re.sub(r"\s+", " ", (text or "").lower()).strip()
 
 
-def score_article(title: str, summary: str, source_weight: float, categories: list[dict]) -> float:
-    text = normalize(title + " " + (summary or ""))
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    # NFKC folds decomposed å/ø/æ so they tokenize like the precomposed forms
+    return _TOKEN_RE.findall(unicodedata.normalize("NFKC", text or "").casefold())
+
+
+class KeywordMatcher:
+    def __init__(self, categories: list[dict]):
+        self.weights = {}
+        self._keyword_categories = {}
+        for c in categories:
+            if not c["enabled"]:
+                continue
+            self.weights[c["name"]] = float(c["weight"])
+            for k in (c["keywords"] or "").split(","):
+                phrase = tuple(tokenize(k))
+                if phrase:
+                    self._keyword_categories.setdefault(phrase, set()).add(c["name"])
+
+        # Phrase trie keyed by token; "" marks the end of a keyword phrase
+        self._trie = {}
+        for phrase in self._keyword_categories:
+            node = self._trie
+            for token in phrase:
+                node = node.setdefault(token, {})
+            node[""] = phrase
+
+    def category_hits(self, text: str) -> dict[str, int]:
+        if not self._trie:
+            return {}
+        tokens = tokenize(text)
+        found = set()
+        for start in range(len(tokens)):
+            node = self._trie.get(tokens[start])
+            pos = start + 1
+            while node is not None:
+                phrase = node.get("")
+                if phrase is not None:
+                    found.add(phrase)
+                if pos >= len(tokens):
+                    break
+                node = node.get(tokens[pos])
+                pos += 1
+        hits = {}
+        for phrase in found:
+            for name in self._keyword_categories[phrase]:
+                hits[name] = hits.get(name, 0) + 1
+        return hits
+
+
+def build_matcher(categories: list[dict]) -> KeywordMatcher:
+    return KeywordMatcher(categories)
+
+
+def score_article(
+    title: str,
+    summary: str,
+    source_weight: float,
+    categories: list[dict],
+    matcher: KeywordMatcher | None = None,
+) -> float:
+    text = title + " " + (summary or "")
+    if matcher is None:
+        matcher = build_matcher(categories)
 
     base = 0.0
     # Title bonus
@@ -15,13 +87,8 @@ def score_article(title: str, summary: str, source_weight: float, categories: li
 
     # Keyword/category scoring
     cat_score = 0.0
-    for c in categories:
-        if not c["enabled"]:
-            continue
-        keywords = [k.strip().lower() for k in (c["keywords"] or "").split(",") if k.strip()]
-        hits = sum(1 for k in keywords if k in text)
-        if hits:
-            cat_score += (hits ** 0.8) * float(c["weight"])  # diminishing returns
+    for name, hits in matcher.category_hits(text).items():
+        cat_score += (hits ** 0.8) * matcher.weights[name]  # diminishing returns
 
     # Source weight multiplier
     score = (base + cat_score) * float(source_weight)
@@ -29,15 +96,18 @@ def score_article(title: str, summary: str, source_weight: float, categories: li
     return float(score)
 
 
-def recency_boost(published_ts: int | None) -> float:
+def recency_boost(published_ts: int | None, now: int | None = None) -> float:
     if not published_ts:
         return 0.0
-    age_sec = max(0, int(time.time()) - int(published_ts))
-    # boost within last 24h
-    if age_sec <= 3600:
-        return 2.0
-    if age_sec <= 6 * 3600:
-        return 1.2
-    if age_sec <= 24 * 3600:
-        return 0.6
-    return 0.0
+    if now is None:
+        now = int(time.time())
+    age_sec = max(0, int(now) - int(published_ts))
+    # continuous decay: +2.0 when fresh, halved every 8h
+    return RECENCY_MAX_BOOST * 0.5 ** (age_sec / RECENCY_HALF_LIFE_SEC)
+
+
+def cluster_boost(source_count: int | None) -> float:
+    if not source_count or source_count < 2:
+        return 0.0
+    # each doubling of covering sources adds a fixed amount, capped
+    return min(CLUSTER_MAX_BOOST, CLUSTER_BOOST_PER_DOUBLING * math.log2(source_count))
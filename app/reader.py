@@ -1,90 +1,411 @@
 from __future__ import annotations
 
+import functools
 import html
 import importlib
 import importlib.util
+import logging
+import multiprocessing
 import re
-from typing import Optional
-
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+import http_client
+from image_cache import fetch_image
 from db import get_cached_article, set_cached_article
 
 
-USER_AGENT = "NIE-Reader/1.0 (+https://github.com/example/nie)"
 MIN_TEXT_LENGTH = 200
+PREFETCH_WORKERS = 3
+PREFETCH_HOST_DELAY_SEC = 2.0
+RENDERED_CACHE_SIZE = 32
+MARKUP_MEMO_SIZE = 256
+EXTRACT_WORKERS = 2
+EXTRACT_QUEUE_SIZE = 4
+CANCEL_POLL_SEC = 0.1
+
+_rendered_cache = OrderedDict()
+_rendered_lock = threading.Lock()
+
+_extract_pool = None
+_extract_slots = threading.BoundedSemaphore(EXTRACT_QUEUE_SIZE)
+
+
+# One scan over the document that stops only at tags which affect the
+# layout (headings, list items, p, br) and at skipped blocks; all other
+# tags are stripped from the text between those stops.
+_MARKUP_TOKEN_RE = re.compile(
+    r"<(?:script|style)\b[^>]*>.*?</(?:script|style)\s*>"
+    r"|<!--.*?-->"
+    r"|<(?P<close>/?)(?P<tag>h[1-3]|li|ul|ol|p|br)\b[^>]*>",
+    re.IGNORECASE | re.DOTALL,
+)
+_OTHER_TAG_RE = re.compile(r"<[^>]+>")
+_HEADING_TAGS = frozenset({"h1", "h2", "h3"})
 
 
 def html_to_simple_markup(raw_html: str) -> str:
     if not raw_html:
         return ""
 
-    text = html.unescape(raw_html)
-    text = re.sub(r"(?is)<(script|style).*?>.*?</\1>", "", text)
-
-    def replace_heading(match):
-        inner = _strip_tags(match.group(1))
-        return f"[b]{inner}[/b]\n\n" if inner else ""
-
-    text = re.sub(r"(?is)<h[1-3][^>]*>(.*?)</h[1-3]>", replace_heading, text)
-
-    def replace_li(match):
-        inner = _strip_tags(match.group(1))
-        return f"• {inner}\n" if inner else ""
-
-    text = re.sub(r"(?is)<li[^>]*>(.*?)</li>", replace_li, text)
-    text = re.sub(r"(?is)<br\s*/?>", "\n", text)
-    text = re.sub(r"(?is)</p\s*>", "\n\n", text)
-    text = re.sub(r"(?is)<p\b[^>]*>", "", text)
-    text = re.sub(r"(?is)<[^>]+>", "", text)
-
-    text = _normalize_whitespace(text)
-    text = _escape_kivy(text)
-    text = text.replace("\\[b\\]", "[b]").replace("\\[/b\\]", "[/b]")
-    return text
-
+    parts = []
+    # Text inside a heading or list item is collected and emitted on close;
+    # any tags inside it are dropped.
+    capture = None
+    captured = []
+
+    def text(raw):
+        if "<" in raw:
+            raw = _OTHER_TAG_RE.sub("", raw)
+        return _escape_kivy(html.unescape(raw))
+
+    def flush_capture():
+        inner = text("".join(captured)).strip()
+        if inner:
+            if capture == "heading":
+                parts.append(f"[b]{inner}[/b]\n\n")
+            else:
+                parts.append(f"• {inner}\n")
+        captured.clear()
+
+    pos = 0
+    for match in _MARKUP_TOKEN_RE.finditer(raw_html):
+        start = match.start()
+        if start > pos:
+            if capture is None:
+                parts.append(text(raw_html[pos:start]))
+            else:
+                captured.append(raw_html[pos:start])
+        pos = match.end()
+
+        tag = match.group("tag")
+        if tag is None:
+            continue
+        tag = tag.lower()
+        if match.group("close"):
+            if capture == "heading":
+                if tag in _HEADING_TAGS:
+                    flush_capture()
+                    capture = None
+            elif capture == "li":
+                if tag in ("li", "ul", "ol"):
+                    flush_capture()
+                    capture = None
+            elif tag == "p":
+                parts.append("\n\n")
+        elif capture is None:
+            if tag in _HEADING_TAGS:
+                capture = "heading"
+            elif tag == "li":
+                capture = "li"
+            elif tag == "br":
+                parts.append("\n")
+        elif capture == "li" and tag == "li":
+            # A new <li> closes an unterminated one
+            flush_capture()
+
+    tail = raw_html[pos:]
+    if capture is not None:
+        # Unterminated heading/list item: keep its text as plain text
+        captured.append(tail)
+        parts.append(text("".join(captured)))
+    elif tail:
+        parts.append(text(tail))
+
+    return _normalize_whitespace("".join(parts))
+
+
+@functools.lru_cache(maxsize=MARKUP_MEMO_SIZE)
+def cached_markup(raw_html: str) -> str:
+    # Keyed on the string itself; CPython caches str hashes, so repeat
+    # lookups of the same summary cost one dict probe
+    return html_to_simple_markup(raw_html)
+
+
+def start_extraction_pool(max_workers: int = EXTRACT_WORKERS):
+    # Forks the workers right away, so call this before Kivy creates its
+    # window or the app starts threads; without fork support (or when it
+    # is never called) extraction runs in the calling thread
+    global _extract_pool
+    if _extract_pool is not None:
+        return
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("fork"),
+    )
+    pool.submit(_noop).result()
+    _extract_pool = pool
 
-def fetch_article_content(url: str, rss_summary: str = "", rss_image_url: str | None = None):
-    cached = get_cached_article(url, max_age_hours=24)
-    if cached:
-        return {"text": cached["text"], "image_url": cached.get("image_url"), "from_cache": True}
 
-    requests_module = _optional_module("requests")
-    if not requests_module:
-        return {"text": rss_summary or "", "image_url": rss_image_url, "used_fallback": True}
+def _noop():
+    return None
 
-    try:
-        response = requests_module.get(
-            url,
-            headers={"User-Agent": USER_AGENT},
-            timeout=10,
-        )
-        response.raise_for_status()
-        html_doc = response.text
-    except Exception:
-        return {"text": rss_summary or "", "image_url": rss_image_url, "used_fallback": True}
 
+def extract_article_text(html_bytes: bytes, encoding: str | None, url: str):
+    # Runs in an extraction worker process: trafilatura first, readability
+    # as fallback. Returns (text, markup).
     text = ""
     trafilatura = _optional_module("trafilatura")
     if trafilatura:
         try:
-            downloaded = trafilatura.fetch_url(url)
-            if downloaded:
-                text = trafilatura.extract(downloaded) or ""
+            text = trafilatura.extract(html_bytes, url=url) or ""
         except Exception:
             text = ""
 
     if not text:
-        text = _extract_with_readability(html_doc)
+        # readability returns HTML: convert it once and use the markup as
+        # the text too, as converting markup again escapes its [b] tags
+        html_doc = html_bytes.decode(encoding or "utf-8", errors="replace")
+        markup = html_to_simple_markup(_extract_with_readability(html_doc))
+        return markup, markup
+    return text, html_to_simple_markup(text)
+
+
+def _run_extraction(html_bytes, encoding, url, is_cancelled):
+    global _extract_pool
+    pool = _extract_pool
+    if pool is None:
+        return extract_article_text(html_bytes, encoding, url)
+
+    # Bounded queue: wait for a free slot, giving up if the reader moved on
+    while not _extract_slots.acquire(timeout=CANCEL_POLL_SEC):
+        if is_cancelled():
+            return None
+    try:
+        future = pool.submit(extract_article_text, html_bytes, encoding, url)
+    except (BrokenProcessPool, RuntimeError):
+        _extract_slots.release()
+        _extract_pool = None
+        return extract_article_text(html_bytes, encoding, url)
+    future.add_done_callback(lambda _future: _extract_slots.release())
+
+    while True:
+        try:
+            return future.result(timeout=CANCEL_POLL_SEC)
+        except FuturesTimeoutError:
+            if is_cancelled():
+                # Queued work is dropped; running work finishes unseen
+                future.cancel()
+                return None
+        except BrokenProcessPool:
+            logging.exception("Extraction pool broke, extracting in-process")
+            _extract_pool = None
+            return extract_article_text(html_bytes, encoding, url)
+        except Exception:
+            logging.exception("Extraction failed for %s", url)
+            return "", ""
+
+
+def fetch_article_content(
+    url: str,
+    rss_summary: str = "",
+    rss_image_url: str | None = None,
+    is_cancelled: Callable[[], bool] | None = None,
+    abort: http_client.Abort | None = None,
+):
+    is_cancelled = is_cancelled or (lambda: False)
+    cached = get_cached_article(url, max_age_hours=24)
+    # Rows cached before markup was stored may hold readability output that
+    # is already markup; converting it again would escape it, so refetch
+    if cached and cached.get("markup") is not None:
+        return {
+            "text": cached["text"],
+            "markup": cached["markup"],
+            "image_url": cached.get("image_url"),
+            "from_cache": True,
+        }
+
+    if is_cancelled():
+        return None
+    try:
+        downloaded = http_client.get_content(
+            url, is_cancelled=is_cancelled, abort=abort
+        )
+        if downloaded is None:
+            return None
+        html_bytes, encoding = downloaded
+        html_doc = html_bytes.decode(encoding or "utf-8", errors="replace")
+    except Exception:
+        return {
+            "text": rss_summary or "",
+            "markup": cached_markup(rss_summary or ""),
+            "image_url": rss_image_url,
+            "used_fallback": True,
+        }
+
+    # One download feeds trafilatura, readability and the og:image lookup.
+    # trafilatura gets the raw bytes so it can sniff the charset itself.
+    if is_cancelled():
+        return None
+    extracted = _run_extraction(html_bytes, encoding, url, is_cancelled)
+    if extracted is None or is_cancelled():
+        return None
+    text, markup = extracted
 
     if len(text.strip()) < MIN_TEXT_LENGTH and rss_summary:
         text = rss_summary
+        markup = cached_markup(rss_summary)
         used_fallback = True
     else:
         used_fallback = False
 
     image_url = rss_image_url or _extract_og_image(html_doc)
     if text.strip():
-        set_cached_article(url, text, image_url)
-    return {"text": text, "image_url": image_url, "used_fallback": used_fallback}
+        set_cached_article(url, text, image_url, markup)
+    return {
+        "text": text,
+        "markup": markup,
+        "image_url": image_url,
+        "used_fallback": used_fallback,
+    }
+
+
+def get_rendered_article(url: str) -> dict | None:
+    with _rendered_lock:
+        rendered = _rendered_cache.get(url)
+        if rendered is not None:
+            _rendered_cache.move_to_end(url)
+        return rendered
+
+
+def load_rendered_article(
+    url: str,
+    rss_summary: str = "",
+    rss_image_url: str | None = None,
+    is_cancelled: Callable[[], bool] | None = None,
+    abort: http_client.Abort | None = None,
+) -> dict | None:
+    rendered = get_rendered_article(url)
+    if rendered is not None:
+        return rendered
+
+    result = fetch_article_content(
+        url,
+        rss_summary=rss_summary,
+        rss_image_url=rss_image_url,
+        is_cancelled=is_cancelled,
+        abort=abort,
+    )
+    if result is None:
+        return None
+    # Fallbacks stay out of memory so the next open retries the fetch
+    if url and not result.get("used_fallback"):
+        with _rendered_lock:
+            _rendered_cache[url] = result
+            _rendered_cache.move_to_end(url)
+            while len(_rendered_cache) > RENDERED_CACHE_SIZE:
+                _rendered_cache.popitem(last=False)
+    return result
+
+
+class ReaderWorker:
+    # Single background loader for the reader screen. Only the most
+    # recently submitted article is kept; submitting a new one aborts the
+    # request in flight, so the worker moves straight on to it.
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._job = None
+        self._generation = 0
+        self._abort = None
+        self._thread = None
+
+    def submit(self, article: dict, callback: Callable[[dict], None]):
+        with self._cond:
+            self._generation += 1
+            self._job = (self._generation, article, callback)
+            self._abort_current()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="nie-reader", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self):
+        with self._cond:
+            self._generation += 1
+            self._job = None
+            self._abort_current()
+
+    def _abort_current(self):
+        if self._abort is not None:
+            self._abort.abort()
+            self._abort = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._job is None:
+                    self._cond.wait()
+                generation, article, callback = self._job
+                self._job = None
+                abort = self._abort = http_client.Abort()
+
+            def is_cancelled(generation=generation):
+                return generation != self._generation
+
+            try:
+                result = load_rendered_article(
+                    article.get("link", ""),
+                    rss_summary=article.get("summary") or "",
+                    rss_image_url=article.get("image_url"),
+                    is_cancelled=is_cancelled,
+                    abort=abort,
+                )
+            except Exception:
+                logging.exception("Reader fetch failed for %s", article.get("link"))
+                continue
+            if result is not None and not is_cancelled():
+                callback(result)
+
+
+def prefetch_articles(
+    articles,
+    max_workers: int = PREFETCH_WORKERS,
+    host_delay: float = PREFETCH_HOST_DELAY_SEC,
+) -> int:
+    by_host = {}
+    for article in articles:
+        url = article.get("link") or ""
+        if not url or get_cached_article(url, max_age_hours=24):
+            continue
+        by_host.setdefault(urlsplit(url).netloc, []).append(article)
+    if not by_host:
+        return 0
+
+    def warm_host(host_articles):
+        warmed = 0
+        for idx, article in enumerate(host_articles):
+            # politeness delay between requests to the same host
+            if idx:
+                time.sleep(host_delay)
+            try:
+                result = load_rendered_article(
+                    article["link"],
+                    rss_summary=article.get("summary") or "",
+                    rss_image_url=article.get("image_url"),
+                )
+            except Exception:
+                logging.exception("Prefetch failed for %s", article["link"])
+                continue
+            fetch_image(result.get("image_url") or article.get("image_url"))
+            if not result.get("used_fallback"):
+                warmed += 1
+        return warmed
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, max_workers), thread_name_prefix="nie-prefetch"
+    ) as executor:
+        return sum(executor.map(warm_host, by_host.values()))
 
 
 def _extract_with_readability(html_doc: str) -> str:
@@ -97,7 +418,7 @@ def _extract_with_readability(html_doc: str) -> str:
         summary_html = doc.summary(html_partial=True)
     except Exception:
         return ""
-    return html_to_simple_markup(summary_html)
+    return summary_html
 
 
 def _extract_og_image(html_doc: str) -> Optional[str]:
@@ -121,18 +442,14 @@ def _extract_og_image(html_doc: str) -> Optional[str]:
     return None
 
 
-def _strip_tags(value: str) -> str:
-    text = re.sub(r"(?is)<[^>]+>", "", value or "")
-    return _escape_kivy(text.strip())
-
-
 def _escape_kivy(value: str) -> str:
     return value.replace("[", "\\[").replace("]", "\\]")
 
 
 def _normalize_whitespace(value: str) -> str:
     value = value.replace("\r\n", "\n").replace("\r", "\n")
-    value = re.sub(r"[ \t]+", " ", value)
+    # Only runs and tabs need rewriting; single spaces are left alone
+    value = re.sub(r"\t[ \t]*| [ \t]+", " ", value)
     value = re.sub(r"\n{3,}", "\n\n", value)
     return value.strip()
 
@@ -1,6 +1,11 @@
 import feedparser
 from dateutil import parser as dtparser
 
+import http_client
+
+
+FEED_TIMEOUT_SEC = 15
+
 
 def _to_unix_seconds(published_str: str | None) -> int | None:
     if not published_str:
@@ -12,8 +17,35 @@ def _to_unix_seconds(published_str: str | None) -> int | None:
         return None
 
 
-def fetch_feed(url: str) -> list[dict[str, object]]:
-    d = feedparser.parse(url)
+def fetch_feed(
+    url: str,
+    timeout: float = FEED_TIMEOUT_SEC,
+    etag: str | None = None,
+    modified: str | None = None,
+) -> dict[str, object]:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    response = http_client.get(url, timeout=timeout, headers=headers)
+    if response.status_code == 304:
+        return {
+            "not_modified": True,
+            "items": [],
+            "etag": response.headers.get("ETag") or etag,
+            "modified": response.headers.get("Last-Modified") or modified,
+        }
+    response.raise_for_status()
+    # The body is already decompressed; only pass headers feedparser
+    # uses for charset and relative-URL resolution.
+    d = feedparser.parse(
+        response.content,
+        response_headers={
+            "content-type": response.headers.get("Content-Type", ""),
+            "content-location": response.url,
+        },
+    )
     items = []
     for e in d.entries:
         guid = getattr(e, "id", None) or getattr(e, "guid", None) or getattr(e, "link", None)
@@ -35,7 +67,12 @@ def fetch_feed(url: str) -> list[dict[str, object]]:
                     "image_url": image_url,
                 }
             )
-    return items
+    return {
+        "not_modified": False,
+        "items": items,
+        "etag": response.headers.get("ETag"),
+        "modified": response.headers.get("Last-Modified"),
+    }
 
 
 def _extract_image_url(entry):
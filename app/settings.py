@@ -9,3 +9,11 @@ class EngineConfig:
     crypto_rotation_seconds: int = 15
     min_score: float = 2.5
     max_items: int = 50
+    fetch_workers: int = 6
+    feed_timeout_sec: int = 15        # per kilde
+    fetch_deadline_sec: int = 60      # hele hentesyklusen
+    prefetch_top_n: int = 15          # fulltekst for de N øverste sakene
+    prefetch_workers: int = 3
+    prefetch_host_delay_sec: float = 2.0
+    maintenance_interval_sec: int = 6 * 3600
+    retention_days: int = 7           # eldre saker flyttes til arkivet
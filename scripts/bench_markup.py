@@ -0,0 +1,68 @@
+"""Benchmark reader.html_to_simple_markup against the old regex pipeline.
+
+Usage: python scripts/bench_markup.py saved_page.html [more.html ...]
+"""
+import html
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from reader import html_to_simple_markup  # noqa: E402
+
+
+def regex_markup(raw_html):
+    if not raw_html:
+        return ""
+
+    def escape(value):
+        return value.replace("[", "\\[").replace("]", "\\]")
+
+    def strip_tags(value):
+        return escape(re.sub(r"(?is)<[^>]+>", "", value or "").strip())
+
+    def replace_heading(match):
+        inner = strip_tags(match.group(1))
+        return f"[b]{inner}[/b]\n\n" if inner else ""
+
+    def replace_li(match):
+        inner = strip_tags(match.group(1))
+        return f"• {inner}\n" if inner else ""
+
+    text = html.unescape(raw_html)
+    text = re.sub(r"(?is)<(script|style).*?>.*?</\1>", "", text)
+    text = re.sub(r"(?is)<h[1-3][^>]*>(.*?)</h[1-3]>", replace_heading, text)
+    text = re.sub(r"(?is)<li[^>]*>(.*?)</li>", replace_li, text)
+    text = re.sub(r"(?is)<br\s*/?>", "\n", text)
+    text = re.sub(r"(?is)</p\s*>", "\n\n", text)
+    text = re.sub(r"(?is)<p\b[^>]*>", "", text)
+    text = re.sub(r"(?is)<[^>]+>", "", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    text = escape(text)
+    return text.replace("\\[b\\]", "[b]").replace("\\[/b\\]", "[/b]")
+
+
+def main(paths):
+    if not paths:
+        print(__doc__.strip())
+        return 1
+    for path in paths:
+        doc = Path(path).read_text(encoding="utf-8", errors="replace")
+        runs = max(1, int(2_000_000 / max(len(doc), 1)))
+        regex_sec = timeit.timeit(lambda: regex_markup(doc), number=runs) / runs
+        parser_sec = timeit.timeit(lambda: html_to_simple_markup(doc), number=runs) / runs
+        same = regex_markup(doc) == html_to_simple_markup(doc)
+        print(
+            f"{Path(path).name}: {len(doc) / 1024:.0f} KB, "
+            f"regex {regex_sec * 1000:.2f} ms, parser {parser_sec * 1000:.2f} ms, "
+            f"{regex_sec / parser_sec:.1f}x, same output: {same}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,112 @@
+"""Check that the ticker query stays index-driven on a large articles table.
+
+Builds a throwaway database with --rows articles (default 100000), prints
+EXPLAIN QUERY PLAN for db.TICKER_QUERY and exits non-zero if articles or
+sources are read by a full table scan, if more than --max-candidates rows
+reach the ranking stage, or if building the parameters and running the
+query takes longer than --max-ms.
+
+Usage: python scripts/check_ticker_plan.py [--rows N] [--max-candidates N] [--max-ms MS]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import db  # noqa: E402
+
+
+def populate(con, rows):
+    names = {row["id"]: row["name"] for row in con.execute("SELECT id, name FROM sources")}
+    source_ids = list(names)
+    rng = random.Random(1)
+    now = int(time.time())
+    batch = []
+    for i in range(rows):
+        source_id = rng.choice(source_ids)
+        published = now - rng.randrange(0, 7 * 86400)
+        batch.append((
+            f"guid-{i}",
+            f"Sak nummer {i}",
+            f"https://example.com/{i}",
+            names[source_id],
+            source_id,
+            published,
+            "Sammendrag " * 10,
+            round(rng.uniform(-1.0, 6.0), 2),
+            published,
+            rng.randrange(1, rows // 3 + 2),
+        ))
+    with con:
+        con.executemany(
+            """INSERT INTO articles(guid,title,link,source_name,source_id,published_ts,
+                                    summary,score,created_ts,cluster_id)
+               VALUES(?,?,?,?,?,?,?,?,?,?)""",
+            batch,
+        )
+        con.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--max-candidates", type=int, default=2000)
+    parser.add_argument("--max-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    # the candidates CTE on its own, to count what the score floor lets through
+    head, sep, _rest = db.TICKER_QUERY.partition("\nstories AS")
+    assert sep, "TICKER_QUERY no longer has a stories CTE"
+    candidates_sql = head.rstrip().rstrip(",") + "\nSELECT COUNT(*) FROM candidates"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "plan.db"
+        db.init_db()
+        con = db.connect()
+        populate(con, args.rows)
+
+        params = db.ticker_query_params(con, min_score=2.5, limit=args.limit)
+        plan = [row["detail"] for row in con.execute(
+            "EXPLAIN QUERY PLAN " + db.TICKER_QUERY, params
+        )]
+        for detail in plan:
+            print(detail)
+
+        candidates = con.execute(candidates_sql, params).fetchone()[0]
+        started = time.perf_counter()
+        params = db.ticker_query_params(con, min_score=2.5, limit=args.limit)
+        count = len(con.execute(db.TICKER_QUERY, params).fetchall())
+        elapsed = (time.perf_counter() - started) * 1000
+        print(
+            f"{count} rows from {candidates} candidates in {elapsed:.1f} ms "
+            f"over {args.rows} articles"
+        )
+        db.close_connection()
+
+    failed = False
+    if candidates > args.max_candidates:
+        print(f"too many candidates: {candidates} > {args.max_candidates}")
+        failed = True
+    if elapsed > args.max_ms:
+        print(f"ticker query too slow: {elapsed:.1f} ms > {args.max_ms:.0f} ms")
+        failed = True
+
+    scans = [
+        detail for detail in plan
+        if detail.split(" ")[0] == "SCAN"
+        and detail.split(" ")[1] in ("a", "s", "articles", "sources")
+        and "INDEX" not in detail
+    ]
+    if scans:
+        print("full table scan in ticker query: " + "; ".join(scans))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())